@@ -5,11 +5,19 @@ import json
 import zipfile
 import shutil
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
 import img2pdf
 import threading
 import queue
 import subprocess
+import multiprocessing
+import glob
+import tempfile
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from pathlib import Path
 from PIL import Image
 from io import BytesIO
@@ -25,10 +33,232 @@ from PyQt5.QtGui import QFont
 from selenium import webdriver
 from selenium.webdriver.firefox.options import Options
 from selenium.webdriver.firefox.service import Service as FirefoxService
-from selenium.webdriver.common.by import By
+from selenium.common.exceptions import JavascriptException
 
 import fitz  # PyMuPDF
 
+# orjson заметно быстрее разбирает большие JSON, но не обязателен
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj):
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode('utf-8')
+
+
+# ============================================================================
+# ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
+# ============================================================================
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+RENDER_DPI = 150  # Разрешение рендера страниц перед апскейлом Real-ESRGAN (x2 -> 300 DPI)
+MARGIN_WHITE_LEVEL = 250  # Пиксели светлее этого уровня считаются белыми полями
+MARGIN_MIN_CROP_AREA = 0.5  # Обрезка полей не должна оставлять меньше этой доли площади
+
+# Таблица для Image.point: содержимое страницы -> 255, белые поля -> 0
+_MARGIN_LUT = [255 if v < MARGIN_WHITE_LEVEL else 0 for v in range(256)]
+
+# Регулярные выражения компилируются один раз при загрузке модуля
+_UNSAFE_CHARS_RE = re.compile(r"[^\w\- ]")
+_JSON_DELIMS_RE = re.compile(rb'[{}"]')
+_JSON_STRING_RE = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_PAGE_NUM_RE = re.compile(r'page_(\d+)')
+
+
+def _safe_filename(name):
+    """Заменяет символы, недопустимые в имени файла, на '_'"""
+    return _UNSAFE_CHARS_RE.sub("_", name)
+
+
+@functools.lru_cache(maxsize=1)
+def _locate_realesrgan(frozen):
+    """Ищет исполняемый файл Real-ESRGAN, найденный путь кэшируется"""
+    if frozen:
+        # Если запущено из EXE
+        if hasattr(sys, '_MEIPASS'):
+            base_path = sys._MEIPASS
+        else:
+            base_path = os.path.dirname(sys.executable)
+        
+        # Ищем в разных местах
+        paths_to_try = [
+            os.path.join(base_path, 'realesrgan-ncnn-vulkan-20220424-windows', 'realesrgan-ncnn-vulkan.exe'),
+            os.path.join(base_path, 'realesrgan-ncnn-vulkan.exe'),
+            os.path.join('.', 'realesrgan-ncnn-vulkan-20220424-windows', 'realesrgan-ncnn-vulkan.exe'),
+            os.path.join('.', 'realesrgan-ncnn-vulkan.exe'),
+        ]
+    else:
+        # Если запущено из скрипта
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        paths_to_try = [
+            os.path.join(script_dir, 'realesrgan-ncnn-vulkan-20220424-windows', 'realesrgan-ncnn-vulkan.exe'),
+            os.path.join(script_dir, 'realesrgan-ncnn-vulkan.exe'),
+        ]
+    
+    for path in paths_to_try:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+_render_document = None  # PDF, открытый в процессе-воркере рендеринга
+
+
+def _open_render_document(pdf_path):
+    """Инициализатор процесса-воркера: открывает PDF один раз на весь процесс"""
+    global _render_document
+    _render_document = fitz.open(pdf_path)
+
+
+def _page_number(path):
+    """Номер страницы из имени вида page_XXXX.png (для сортировки без учета ширины номера)"""
+    return int(_PAGE_NUM_RE.search(os.path.basename(path)).group(1))
+
+
+def _page_ranges(numbers):
+    """Сворачивает отсортированные номера страниц в строку вида '1-32, 65-70'"""
+    ranges = []
+    for n in numbers:
+        if ranges and ranges[-1][1] == n - 1:
+            ranges[-1][1] = n
+        else:
+            ranges.append([n, n])
+    return ", ".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+def _bmp_frame_size(rect):
+    """Размер в байтах 24-битного BMP страницы с размерами rect, отрендеренной в RENDER_DPI"""
+    width = int(rect.width * RENDER_DPI / 72) + 1
+    height = int(rect.height * RENDER_DPI / 72) + 1
+    # Строки BMP выравниваются на 4 байта, плюс заголовки файла
+    return (width * 3 + 3) // 4 * 4 * height + 54
+
+
+def _crop_white_margins(img):
+    """
+    Обрезает однородные белые поля страницы. Если после обрезки остается
+    меньше MARGIN_MIN_CROP_AREA площади (например, темная страница), возвращает кадр целиком.
+    """
+    bbox = img.convert("L").point(_MARGIN_LUT).getbbox()
+    if bbox is None or bbox == (0, 0, img.width, img.height):
+        return img
+    left, top, right, bottom = bbox
+    if (right - left) * (bottom - top) < MARGIN_MIN_CROP_AREA * img.width * img.height:
+        return img
+    return img.crop(bbox)
+
+
+def _render_pdf_pages(page_indexes, folder):
+    """
+    Рендерит указанные страницы PDF в файлы page_XXXX.bmp в папке folder.
+    Выполняется в процессе-воркере, возвращает число отрендеренных страниц.
+    """
+    for i in page_indexes:
+        pix = _render_document[i].get_pixmap(dpi=RENDER_DPI)
+        # Промежуточные кадры сразу уходят в Real-ESRGAN, поэтому пишем несжатый BMP
+        # вместо PNG: так не тратится время на zlib. Изображение смотрит прямо
+        # в буфер пиксмапа, без копии samples
+        img = Image.frombuffer("RGB", (pix.width, pix.height), pix.samples_mv,
+                               "raw", "RGB", pix.stride, 1)
+        # Белые поля только тратят время GPU, поэтому в Real-ESRGAN уходит содержимое страницы
+        img = _crop_white_margins(img)
+        img.save(os.path.join(folder, f"page_{i+1:04d}.bmp"))
+    return len(page_indexes)
+
+
+class _ConsumedImage:
+    """
+    Изображение для img2pdf, которое открывается только в момент чтения
+    и сразу удаляется с диска. Одновременно открыт не больше одного файла.
+    """
+    def __init__(self, path):
+        self.path = path
+    
+    def read(self):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        os.remove(self.path)
+        return data
+
+
+def _ordered_names(archive):
+    """
+    Возвращает имена файлов архива по порядку.
+    Архивы глав обычно уже хранят страницы по порядку, поэтому сортировка
+    выполняется, только если линейная проверка нашла нарушение порядка.
+    """
+    names = archive.namelist()
+    if any(a > b for a, b in zip(names, names[1:])):
+        names.sort()
+    return names
+
+
+def _extract_json_object(html, marker):
+    """
+    Возвращает байты JSON-объекта, который идет после marker на странице.
+    Конец объекта ищется подсчетом фигурных скобок за один линейный проход,
+    скобки внутри строковых литералов пропускаются.
+    """
+    start = html.find(marker)
+    if start == -1:
+        return None
+    start = html.find(b'{', start + len(marker))
+    if start == -1:
+        return None
+    
+    depth = 0
+    pos = start
+    while True:
+        match = _JSON_DELIMS_RE.search(html, pos)
+        if not match:
+            return None
+        
+        if match.group() == b'"':
+            string = _JSON_STRING_RE.match(html, match.start())
+            if not string:
+                return None
+            pos = string.end()
+            continue
+        
+        depth += 1 if match.group() == b'{' else -1
+        pos = match.end()
+        if depth == 0:
+            return html[start:pos]
+
+
+def _save_pages_as_pdf(pages, pdf_name):
+    """
+    Собирает PDF через PyMuPDF из страниц, лежащих в архивах глав.
+    pages — список пар (путь к архиву главы, имя изображения в архиве).
+    Изображения читаются из архива по одному и вставляются как есть (JPEG не перекодируется).
+    """
+    doc = fitz.open()
+    archive_path, archive = None, None
+    try:
+        for zip_path, name in pages:
+            # Страницы одной главы идут подряд, поэтому архив открывается один раз
+            if zip_path != archive_path:
+                if archive:
+                    archive.close()
+                archive_path, archive = zip_path, zipfile.ZipFile(zip_path)
+            
+            data = archive.read(name)
+            filetype = os.path.splitext(name)[1].lstrip('.').lower()
+            with fitz.open(stream=data, filetype=filetype) as img:
+                rect = img[0].rect
+            page = doc.new_page(width=rect.width, height=rect.height)
+            page.insert_image(rect, stream=data, keep_proportion=True)
+        doc.save(pdf_name, garbage=4, deflate=True)
+    finally:
+        if archive:
+            archive.close()
+        doc.close()
 
 # ============================================================================
 # КОНФИГУРАЦИЯ
@@ -51,8 +281,8 @@ class Config:
         """Загружает конфигурацию из файла"""
         try:
             if os.path.exists(cls.CONFIG_FILE):
-                with open(cls.CONFIG_FILE, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
+                with open(cls.CONFIG_FILE, 'rb') as f:
+                    config = _json_loads(f.read())
                     # Объединяем с дефолтными значениями
                     for key, value in cls.DEFAULT_CONFIG.items():
                         if key not in config:
@@ -70,8 +300,8 @@ class Config:
     def save(cls, config):
         """Сохраняет конфигурацию в файл"""
         try:
-            with open(cls.CONFIG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=2, ensure_ascii=False)
+            # Сериализуем целиком и записываем одним вызовом
+            Path(cls.CONFIG_FILE).write_bytes(_json_dumps(config))
             return True
         except Exception as e:
             print(f"❌ Ошибка сохранения конфигурации: {e}")
@@ -102,10 +332,44 @@ class MangaDownloader(QThread):
     # Константы
     COOKIE_FILE = "comx_life_cookies_v2.json"
     DOWNLOADS_DIR = "downloads"
-    TEMP_DIR = "combined_temp"
+    TEMP_DIR = "combined_temp"  # больше не создается, удаляется при очистке как остаток старых версий
     REQUEST_DELAY = 0.5
+    DOWNLOAD_WORKERS = 8  # Количество глав, скачиваемых одновременно
+    ARCHIVE_WORKERS = 8  # Количество архивов глав, читаемых одновременно при сборке CBZ
     PAGES_PER_PDF = 100  # Автоматическое разделение по 100 страниц
     
+    # Кэш между запусками в рамках одной сессии приложения
+    _cached_geckodriver = None  # путь к найденному драйверу
+    _cached_cookies = None  # (mtime файла cookies, разобранный список)
+    URL_POLL_INTERVAL = 0.5  # Интервал опроса браузера в режиме ожидания кнопки
+    
+    # Выставляет все переданные cookies за один вызов WebDriver
+    # и возвращает имена cookies, которые браузер в итоге принял
+    SET_COOKIES_SCRIPT = '''
+        arguments[0].forEach(function (cookie) { document.cookie = cookie; });
+        return document.cookie.split('; ').map(function (pair) { return pair.split('=')[0]; });
+    '''
+    
+    # Возвращает текущий адрес и один раз подменяет кнопку на странице манги.
+    # Подменённая кнопка помечается, поэтому повторные опросы её не трогают.
+    PATCH_BUTTON_SCRIPT = '''
+        var href = window.location.href;
+        if (href.indexOf('.html') === -1) {
+            return [href, false];
+        }
+        var btn = document.querySelector('a.page__btn-track.js-follow-status');
+        if (!btn || btn.dataset.mangaDownload) {
+            return [href, false];
+        }
+        btn.dataset.mangaDownload = '1';
+        btn.textContent = '⬇️ Скачать';
+        btn.style.backgroundColor = '#28a745';
+        btn.style.color = '#fff';
+        btn.style.fontWeight = 'bold';
+        btn.onclick = () => { window.location.href += '/download'; };
+        return [href, true];
+    '''
+    
     def __init__(self, output_format="cbz", base_url="https://com-x.life", download_all=False, firefox_path=None):
         super().__init__()
         self.url = None
@@ -119,8 +383,22 @@ class MangaDownloader(QThread):
         self.output_format = output_format.lower()
         self.download_all = download_all
         self.firefox_path = firefox_path
-        self._is_cancelled = False
+        self._cancel = threading.Event()  # флаг отмены; wait() прерывает паузы сразу при отмене
         self.created_files = []  # список созданных файлов
+        self.session = self._create_session()
+
+    def _create_session(self):
+        """Создает общую HTTP-сессию с пулом keep-alive соединений и повторами"""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=0.3)
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update(self.headers)
+        return session
 
     def run(self):
         self.cleanup()
@@ -142,7 +420,7 @@ class MangaDownloader(QThread):
             self.finished.emit(False, [])
 
     def cancel(self):
-        self._is_cancelled = True
+        self._cancel.set()
 
     def cleanup(self):
         for dir_name in [self.DOWNLOADS_DIR, self.TEMP_DIR]:
@@ -173,16 +451,10 @@ class MangaDownloader(QThread):
 
         if self.cookie_file.exists():
             self.log.emit("🍪 Пробую восстановить сессию...")
-            with open(self.cookie_file, "r", encoding="utf-8") as f:
-                cookies = json.load(f)
+            cookies = self._read_cookie_file()
 
             driver.delete_all_cookies()
-            for c in cookies:
-                c.pop("sameSite", None)
-                try:
-                    driver.add_cookie(c)
-                except Exception as e:
-                    self.log.emit(f"⚠️ Cookie {c.get('name')} не добавлен: {e}")
+            self._restore_cookies(driver, cookies)
 
             driver.refresh()
             time.sleep(2)
@@ -196,18 +468,54 @@ class MangaDownloader(QThread):
         self.log.emit("📦 Ожидание страницы манги...")
 
         while not driver.get_cookie("dle_user_id"):
-            if self._is_cancelled:
+            if self._cancel.is_set():
                 driver.quit()
                 self.finished.emit(False, [])
                 return None
-            time.sleep(1)
+            self._cancel.wait(1)
 
         self.cookies = driver.get_cookies()
-        with open(self.cookie_file, "w", encoding="utf-8") as f:
-            json.dump(self.cookies, f, indent=2, ensure_ascii=False)
+        self.cookie_file.write_bytes(_json_dumps(self.cookies))
 
         return driver
 
+    def _restore_cookies(self, driver, cookies):
+        """
+        Добавляет cookies в браузер.
+        Обычные cookies выставляются одним скриптом через document.cookie,
+        поштучно через add_cookie добавляются только HttpOnly и те,
+        которые браузер не принял из скрипта.
+        """
+        script_cookies = [c for c in cookies if not c.get("httpOnly")]
+        single_cookies = [c for c in cookies if c.get("httpOnly")]
+        
+        if script_cookies:
+            now = time.time()
+            assignments = []
+            for c in script_cookies:
+                parts = [f"{c['name']}={c['value']}", f"path={c.get('path') or '/'}"]
+                if c.get("domain"):
+                    parts.append(f"domain={c['domain']}")
+                if c.get("expiry"):
+                    parts.append(f"max-age={int(c['expiry'] - now)}")
+                if c.get("secure"):
+                    parts.append("secure")
+                assignments.append("; ".join(parts))
+            
+            try:
+                present = set(driver.execute_script(self.SET_COOKIES_SCRIPT, assignments))
+            except Exception as e:
+                self.log.emit(f"⚠️ Не удалось выставить cookies скриптом: {e}")
+                present = set()
+            single_cookies += [c for c in script_cookies if c["name"] not in present]
+        
+        for c in single_cookies:
+            c.pop("sameSite", None)
+            try:
+                driver.add_cookie(c)
+            except Exception as e:
+                self.log.emit(f"⚠️ Cookie {c.get('name')} не добавлен: {e}")
+
     def _get_webdriver_with_autodownload(self, options):
         """Автоматически находит или скачивает драйвер"""
         import platform
@@ -249,17 +557,23 @@ class MangaDownloader(QThread):
                 '/usr/bin/geckodriver',
             ])
         
-        geckodriver_path = None
-        for path in possible_paths:
-            if os.path.exists(path):
-                geckodriver_path = path
-                self.log.emit(f"✅ Найден драйвер: {path}")
-                break
-        
-        if not geckodriver_path:
-            # Пытаемся скачать драйвер автоматически
-            self.log.emit("⚠️ Драйвер не найден, пробую скачать...")
-            geckodriver_path = self._download_geckodriver(base_path)
+        geckodriver_path = MangaDownloader._cached_geckodriver
+        if geckodriver_path and os.path.exists(geckodriver_path):
+            self.log.emit(f"✅ Найден драйвер: {geckodriver_path}")
+        else:
+            geckodriver_path = None
+            for path in possible_paths:
+                if os.path.exists(path):
+                    geckodriver_path = path
+                    self.log.emit(f"✅ Найден драйвер: {path}")
+                    break
+            
+            if not geckodriver_path:
+                # Пытаемся скачать драйвер автоматически
+                self.log.emit("⚠️ Драйвер не найден, пробую скачать...")
+                geckodriver_path = self._download_geckodriver(base_path)
+            
+            MangaDownloader._cached_geckodriver = geckodriver_path
         
         if not geckodriver_path:
             self.log.emit("❌ Не удалось найти или скачать драйвер!")
@@ -318,7 +632,7 @@ class MangaDownloader(QThread):
                     archive_type = "tar.gz"
                 else:  # Intel
                     url = "https://github.com/mozilla/geckodriver/releases/download/v0.34.0/geckodriver-v0.34.0-macos.tar.gz"
-                    filename = "geckoddriver"
+                    filename = "geckodriver"
                     archive_type = "tar.gz"
             else:
                 self.log.emit(f"❌ Неподдерживаемая система: {system}")
@@ -327,20 +641,19 @@ class MangaDownloader(QThread):
             self.log.emit(f"📥 Скачиваю драйвер для {system} {arch}...")
             self.log.emit(f"🔗 URL: {url}")
             
-            # Скачиваем архив
-            response = requests.get(url, stream=True)
-            if response.status_code != 200:
-                self.log.emit(f"❌ Ошибка скачивания: {response.status_code}")
-                return None
-            
-            # Сохраняем архив
             temp_dir = os.path.join(base_path, "temp_geckodriver")
-            os.makedirs(temp_dir, exist_ok=True)
-            
             archive_path = os.path.join(temp_dir, f"geckodriver.{archive_type}")
-            with open(archive_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            
+            # Скачиваем и сохраняем архив крупными блоками
+            with self.session.get(url, stream=True) as response:
+                if response.status_code != 200:
+                    self.log.emit(f"❌ Ошибка скачивания: {response.status_code}")
+                    return None
+                
+                os.makedirs(temp_dir, exist_ok=True)
+                response.raw.decode_content = True
+                with open(archive_path, 'wb') as f:
+                    shutil.copyfileobj(response.raw, f, length=1 << 20)
             
             self.log.emit("📦 Распаковываю архив...")
             
@@ -352,17 +665,20 @@ class MangaDownloader(QThread):
                     # Ищем geckodriver в архиве
                     for file_info in zip_ref.infolist():
                         if "geckodriver" in file_info.filename.lower():
-                            with open(extract_path, 'wb') as f:
-                                f.write(zip_ref.read(file_info.filename))
+                            with zip_ref.open(file_info) as src, open(extract_path, 'wb') as f:
+                                shutil.copyfileobj(src, f, length=1 << 20)
                             break
             else:  # tar.gz
                 import tarfile
                 with tarfile.open(archive_path, 'r:gz') as tar_ref:
-                    for member in tar_ref.getmembers():
-                        if "geckodriver" in member.name.lower():
-                            with open(extract_path, 'wb') as f:
-                                f.write(tar_ref.extractfile(member).read())
+                    # Читаем записи по одной и останавливаемся на первом совпадении
+                    member = tar_ref.next()
+                    while member is not None:
+                        if member.isfile() and "geckodriver" in member.name.lower():
+                            with tar_ref.extractfile(member) as src, open(extract_path, 'wb') as f:
+                                shutil.copyfileobj(src, f, length=1 << 20)
                             break
+                        member = tar_ref.next()
             
             # Делаем исполняемым на Unix-системах
             if system != "windows":
@@ -379,11 +695,19 @@ class MangaDownloader(QThread):
             return None
 
     def _auto_download_if_manga_page(self, driver):
-        processed_url = None
+        """Следит за страницами в браузере и подменяет кнопку на 'Скачать'"""
+        checked_url = None
 
-        while not self._is_cancelled:
+        while not self._cancel.is_set():
             try:
-                current_url = driver.current_url
+                # Один вызов WebDriver и возвращает адрес, и подменяет кнопку, если она появилась
+                try:
+                    current_url, patched = driver.execute_script(self.PATCH_BUTTON_SCRIPT)
+                except JavascriptException:
+                    # Страница перезагружается — пробуем на следующей итерации
+                    self._cancel.wait(self.URL_POLL_INTERVAL)
+                    continue
+
                 if current_url and current_url.endswith('/download'):
                     self.url = current_url.replace('/download', '')
                     self.log.emit(f"📍 Начинаем скачивание манги: {self.url}")
@@ -392,23 +716,14 @@ class MangaDownloader(QThread):
                     self.finished.emit(True, self.created_files)
                     return
 
-                elif current_url and "/" in current_url and ".html" in current_url and current_url != processed_url:
+                if current_url and ".html" in current_url and current_url != checked_url:
                     self.log.emit(f"🔍 Проверка страницы: {current_url}")
-                    try:
-                        btn = driver.find_element(By.CSS_SELECTOR, 'a.page__btn-track.js-follow-status')
-                        driver.execute_script('''
-                            arguments[0].textContent = '⬇️ Скачать';
-                            arguments[0].style.backgroundColor = '#28a745';
-                            arguments[0].style.color = '#fff';
-                            arguments[0].style.fontWeight = 'bold';
-                            arguments[0].onclick = () => { window.location.href += '/download'; };
-                        ''', btn)
-                        self.log.emit("✅ Кнопка заменена на 'Скачать'")
-                        processed_url = current_url
-                    except Exception as e:
-                        self.log.emit(f"⚠️ Кнопка не найдена: {e}")
-
-                time.sleep(0.1)
+                    checked_url = current_url
+
+                if patched:
+                    self.log.emit("✅ Кнопка заменена на 'Скачать'")
+
+                self._cancel.wait(self.URL_POLL_INTERVAL)
 
             except Exception as e:
                 self.log.emit(f"❌ Ошибка: {e}")
@@ -424,14 +739,14 @@ class MangaDownloader(QThread):
             self.log.emit("⏳ Ожидаю страницу манги...")
             
             manga_url = None
-            while not self._is_cancelled:
+            while not self._cancel.is_set():
                 current_url = driver.current_url
                 if current_url and "/" in current_url and ".html" in current_url and "read" not in current_url:
                     manga_url = current_url
                     break
-                time.sleep(1)
+                self._cancel.wait(1)
             
-            if self._is_cancelled:
+            if self._cancel.is_set():
                 driver.quit()
                 return
             
@@ -463,7 +778,7 @@ class MangaDownloader(QThread):
         
         self._download_chapters(chapters, news_id)
         
-        if not self._is_cancelled:
+        if not self._cancel.is_set():
             if self.output_format == "pdf":
                 created_files = self._create_auto_split_pdf(manga_title_safe)
                 if created_files:
@@ -472,7 +787,7 @@ class MangaDownloader(QThread):
             else:
                 final_file = Path(f"{manga_title_safe}.cbz")
                 self._create_cbz_archive(final_file)
-                if not self._is_cancelled and final_file.exists():
+                if not self._cancel.is_set() and final_file.exists():
                     self.log.emit(f"✅ Готово: {final_file}")
         
         self.cleanup()
@@ -482,31 +797,49 @@ class MangaDownloader(QThread):
         if not self.cookies:
             self.log.emit("⚠️ Предупреждение: cookies не заданы — загружаю из файла")
             try:
-                with open(self.cookie_file, "r", encoding="utf-8") as f:
-                    raw = json.load(f)
-                    self.cookies = raw if isinstance(raw, list) else [
-                        {"name": k, "value": v} for k, v in raw.items()
-                    ]
+                self.cookies = self._read_cookie_file()
             except Exception as e:
                 self.log.emit(f"❌ Не удалось загрузить cookies из файла: {e}")
                 return False
+        
+        # Cookies задаются сессии один раз и уходят со всеми последующими запросами
+        self.session.cookies.update({c["name"]: c["value"] for c in self.cookies})
         return True
 
+    def _read_cookie_file(self):
+        """
+        Читает cookies из файла. Разобранный список кэшируется на уровне класса
+        и перечитывается, только если файл изменился с прошлого запуска.
+        """
+        mtime = os.stat(self.cookie_file).st_mtime_ns
+        cached = MangaDownloader._cached_cookies
+        if not cached or cached[0] != mtime:
+            with open(self.cookie_file, "rb") as f:
+                raw = _json_loads(f.read())
+            cookies = raw if isinstance(raw, list) else [
+                {"name": k, "value": v} for k, v in raw.items()
+            ]
+            cached = MangaDownloader._cached_cookies = (mtime, cookies)
+        
+        # Возвращаем копии, чтобы изменения cookies не портили кэш
+        return [dict(c) for c in cached[1]]
+
     def _get_manga_data(self):
         """Получает данные манги из HTML страницы"""
         self.download_started.emit()
         self.log.emit(f"📥 Скачивание HTML: {self.url}")
         self.progress.emit(50, "Получение данных манги...")
         
-        resp = requests.get(self.url, headers=self.headers, cookies={c['name']: c['value'] for c in self.cookies})
-        html = resp.text
+        resp = self.session.get(self.url)
+        # Ищем по байтам ответа, чтобы не декодировать всю страницу в строку
+        html = resp.content
 
-        match = re.search(r'window\.__DATA__\s*=\s*({.*?})\s*;', html, re.DOTALL)
-        if not match:
+        raw_data = _extract_json_object(html, b'window.__DATA__')
+        if not raw_data:
             self.log.emit("❌ Не найден window.__DATA__")
             return None
 
-        data = json.loads(match.group(1))
+        data = _json_loads(raw_data)
         chapters = data["chapters"][::-1]
         manga_title = data.get("title", "Manga").strip()
         
@@ -524,39 +857,56 @@ class MangaDownloader(QThread):
 
     def _prepare_directories(self, manga_title):
         """Подготавливает директории для скачивания"""
-        manga_title_safe = re.sub(r"[^\w\- ]", "_", manga_title)
+        manga_title_safe = _safe_filename(manga_title)
         
         downloads_dir = Path(self.DOWNLOADS_DIR)
-        combined_dir = Path(self.TEMP_DIR)
-        
         downloads_dir.mkdir(exist_ok=True)
-        combined_dir.mkdir(exist_ok=True)
         
         return manga_title_safe
 
     def _download_chapters(self, chapters, news_id):
-        """Скачивает все главы манги"""
-        self.log.emit(f"🔢 Глав: {len(chapters)}")
+        """Скачивает все главы манги параллельно в несколько потоков"""
+        total = len(chapters)
+        self.log.emit(f"🔢 Глав: {total}")
         
-        for i, chapter in enumerate(chapters, 1):
-            if self._is_cancelled:
-                self.log.emit("❌ Скачивание отменено")
-                self.cleanup()
-                return
-
-            title = chapter["title"]
-            chapter_id = chapter["id"]
-            filename = re.sub(r"[^\w\- ]", "_", f"{i:06}_{title}") + ".zip"
-            zip_path = Path(self.DOWNLOADS_DIR) / filename
-
-            progress = 50 + (i / len(chapters)) * 40
-            self.progress.emit(int(progress), f"Скачивание главы {i}/{len(chapters)}: {title}")
-            self.log.emit(f"⬇️ {i}/{len(chapters)}: {title}")
+        with ThreadPoolExecutor(max_workers=self.DOWNLOAD_WORKERS) as executor:
+            futures = {}
+            for i, chapter in enumerate(chapters, 1):
+                title = chapter["title"]
+                filename = _safe_filename(f"{i:06}_{title}") + ".zip"
+                zip_path = Path(self.DOWNLOADS_DIR) / filename
+                future = executor.submit(self._download_chapter_worker, i, total, chapter, news_id, zip_path)
+                futures[future] = title
             
-            if self._download_chapter(chapter_id, news_id, zip_path, title):
-                self.log.emit(f"✅ Скачано: {title}")
-            
-            time.sleep(self.REQUEST_DELAY)
+            done = 0
+            for future in as_completed(futures):
+                if self._cancel.is_set():
+                    for f in futures:
+                        f.cancel()
+                    break
+                
+                done += 1
+                title = futures[future]
+                progress = 50 + (done / total) * 40
+                self.progress.emit(int(progress), f"Скачано глав {done}/{total}: {title}")
+                
+                if future.result():
+                    self.log.emit(f"✅ Скачано: {title}")
+        
+        if self._cancel.is_set():
+            self.log.emit("❌ Скачивание отменено")
+            self.cleanup()
+
+    def _download_chapter_worker(self, i, total, chapter, news_id, zip_path):
+        """Скачивает одну главу в рабочем потоке с паузой для снижения нагрузки на сайт"""
+        if self._cancel.is_set():
+            return False
+        
+        title = chapter["title"]
+        self.log.emit(f"⬇️ {i}/{total}: {title}")
+        ok = self._download_chapter(chapter["id"], news_id, zip_path, title)
+        self._cancel.wait(self.REQUEST_DELAY)
+        return ok
 
     def _download_chapter(self, chapter_id, news_id, zip_path, title):
         """Скачивает одну главу манги"""
@@ -568,14 +918,11 @@ class MangaDownloader(QThread):
                 "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
                 "Referer": self.url,
                 "X-Requested-With": "XMLHttpRequest",
-                "Origin": domain,
-                "User-Agent": self.headers["User-Agent"]
+                "Origin": domain
             }
-
-            cookies = {c["name"]: c["value"] for c in self.cookies}
             
             api_url = f"{domain}/engine/ajax/controller.php?mod=api&action=chapters/download"
-            link_resp = requests.post(api_url, headers=headers, data=payload, cookies=cookies)
+            link_resp = self.session.post(api_url, headers=headers, data=payload)
             
             if link_resp.status_code != 200:
                 raise ValueError(f"Ошибка API: {link_resp.status_code}")
@@ -586,81 +933,111 @@ class MangaDownloader(QThread):
                 raise ValueError("Поле 'data' не найдено в JSON")
 
             download_url = "https:" + raw_url.replace("\\/", "/")
-            r = requests.get(download_url, headers=self.headers, cookies=cookies)
-            
-            if r.ok:
+            # Архив пишется на диск по частям, не загружаясь целиком в память
+            with self.session.get(download_url, stream=True) as r:
+                if not r.ok:
+                    self.log.emit(f"❌ Ошибка {r.status_code} при скачивании {title}")
+                    return False
+                
+                r.raw.decode_content = True
                 with open(zip_path, "wb") as f:
-                    f.write(r.content)
+                    shutil.copyfileobj(r.raw, f, length=1 << 20)
                 return True
-            else:
-                self.log.emit(f"❌ Ошибка {r.status_code} при скачивании {title}")
-                return False
 
         except Exception as e:
             self.log.emit(f"❌ Ошибка при обработке главы {title}: {e}")
+            # Недокачанный архив сломает сборку CBZ/PDF
+            if zip_path.exists():
+                zip_path.unlink()
             return False
 
+    def _list_chapter_archives(self):
+        """Возвращает архивы скачанных глав по порядку (имена начинаются с номера главы)"""
+        with os.scandir(self.DOWNLOADS_DIR) as entries:
+            zip_files = [entry.path for entry in entries if entry.name.endswith(".zip")]
+        zip_files.sort()
+        return zip_files
+
     def _create_cbz_archive(self, final_cbz):
         """Создает CBZ архив из скачанных файлов"""
         self.log.emit("📦 Архивация в CBZ...")
         self.progress.emit(95, "Создание CBZ архива...")
         
         index = 1
-        with zipfile.ZipFile(final_cbz, "w") as cbz:
-            for zip_file in sorted(Path(self.DOWNLOADS_DIR).glob("*.zip")):
-                if self._is_cancelled:
+        zip_files = iter(self._list_chapter_archives())
+        window = self.ARCHIVE_WORKERS * 2
+        pending = deque()
+        
+        # Страницы уже сжаты (JPEG/PNG), поэтому копируем их без повторного сжатия
+        with zipfile.ZipFile(final_cbz, "w", compression=zipfile.ZIP_STORED) as cbz, \
+                ThreadPoolExecutor(max_workers=self.ARCHIVE_WORKERS) as executor:
+            while True:
+                # Архивы глав читаются параллельно, но в памяти держим ограниченное их число
+                while len(pending) < window:
+                    zip_file = next(zip_files, None)
+                    if zip_file is None:
+                        break
+                    pending.append(executor.submit(self._read_zip_pages, zip_file))
+                
+                if not pending:
+                    break
+                
+                if self._cancel.is_set():
                     self.log.emit("❌ Архивация отменена")
+                    for future in pending:
+                        future.cancel()
                     break
+                
+                # Запись идёт в одном потоке и строго по порядку глав
+                for ext, data in pending.popleft().result():
+                    cbz.writestr(f"{index:06}{ext}", data)
+                    index += 1
 
-                with zipfile.ZipFile(zip_file) as z:
-                    for name in sorted(z.namelist()):
-                        if self._is_cancelled:
-                            break
-
-                        ext = os.path.splitext(name)[1].lower()
-                        out_name = f"{index:06}{ext}"
-                        combined_dir = Path(self.TEMP_DIR)
-                        z.extract(name, path=combined_dir)
-                        os.rename(combined_dir / name, combined_dir / out_name)
-                        cbz.write(combined_dir / out_name, arcname=out_name)
-                        index += 1
-
-        if self._is_cancelled and final_cbz.exists():
+        if self._cancel.is_set() and final_cbz.exists():
             try:
                 final_cbz.unlink()
                 self.log.emit(f"🧹 Удалён неполный архив: {final_cbz}")
             except Exception as e:
                 self.log.emit(f"⚠️ Не удалось удалить архив: {e}")
 
+    def _read_zip_pages(self, zip_file):
+        """Читает страницы архива главы в память (выполняется в рабочем потоке)"""
+        pages = []
+        with zipfile.ZipFile(zip_file) as z:
+            for name in _ordered_names(z):
+                if self._cancel.is_set():
+                    break
+                if name.endswith("/"):
+                    continue
+                
+                ext = os.path.splitext(name)[1].lower()
+                pages.append((ext, z.read(name)))
+        return pages
+
     def _create_auto_split_pdf(self, manga_title_safe):
         """Автоматически создает разделенные PDF файлы по 100 страниц"""
         self.log.emit("📄 Создание PDF файлов (автоматическое разделение по 100 страниц)...")
         self.progress.emit(95, f"Создание PDF по {self.PAGES_PER_PDF} страниц в каждом...")
         
+        # Собираем только ссылки на страницы (архив, имя файла) — сами изображения
+        # читаются из архивов при сборке PDF, без распаковки на диск
         image_files = []
         
-        for zip_file in sorted(Path(self.DOWNLOADS_DIR).glob("*.zip")):
-            if self._is_cancelled:
+        for zip_file in self._list_chapter_archives():
+            if self._cancel.is_set():
                 self.log.emit("❌ Создание PDF отменено")
                 break
                 
             with zipfile.ZipFile(zip_file) as z:
-                z.extractall(path=Path(self.TEMP_DIR))
-                
-                for name in sorted(z.namelist()):
-                    if self._is_cancelled:
-                        break
-                        
-                    if name.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp', '.gif')):
-                        image_path = Path(self.TEMP_DIR) / name
-                        if image_path.exists():
-                            image_files.append(str(image_path))
+                for name in _ordered_names(z):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        image_files.append((zip_file, name))
         
         if not image_files:
             self.log.emit("❌ Не найдено изображений для создания PDF")
             return []
             
-        if self._is_cancelled:
+        if self._cancel.is_set():
             return []
         
         total_pages = len(image_files)
@@ -672,8 +1049,7 @@ class MangaDownloader(QThread):
             self.log.emit(f"📄 Создание единого PDF файла ({total_pages} страниц)...")
             
             try:
-                with open(pdf_name, "wb") as f:
-                    f.write(img2pdf.convert(image_files))
+                _save_pages_as_pdf(image_files, pdf_name)
                 
                 self.created_files.append(pdf_name)
                 self.log.emit(f"✅ Создан: {pdf_name}")
@@ -688,30 +1064,39 @@ class MangaDownloader(QThread):
         
         created_files = []
         
-        for i in range(num_files):
-            if self._is_cancelled:
-                break
+        # Части собираются независимо, поэтому кодируются параллельно в отдельных процессах
+        workers = min(num_files, os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for i in range(num_files):
+                start_idx = i * self.PAGES_PER_PDF
+                end_idx = min((i + 1) * self.PAGES_PER_PDF, total_pages)
                 
-            start_idx = i * self.PAGES_PER_PDF
-            end_idx = min((i + 1) * self.PAGES_PER_PDF, total_pages)
-            
-            current_images = image_files[start_idx:end_idx]
-            
-            # Все файлы получают номер части
-            pdf_name = f"{manga_title_safe}_part_{i+1:03d}.pdf"
+                current_images = image_files[start_idx:end_idx]
                 
-            self.log.emit(f"📄 Создание PDF {i+1}/{num_files} (страницы {start_idx+1}-{end_idx})...")
-            
-            try:
-                with open(pdf_name, "wb") as f:
-                    f.write(img2pdf.convert(current_images))
+                # Все файлы получают номер части
+                pdf_name = f"{manga_title_safe}_part_{i+1:03d}.pdf"
                 
-                self.created_files.append(pdf_name)
-                created_files.append(pdf_name)
-                self.log.emit(f"✅ Создан: {pdf_name}")
+                self.log.emit(f"📄 Создание PDF {i+1}/{num_files} (страницы {start_idx+1}-{end_idx})...")
+                futures[executor.submit(_save_pages_as_pdf, current_images, pdf_name)] = pdf_name
+            
+            for future in as_completed(futures):
+                if self._cancel.is_set():
+                    for f in futures:
+                        f.cancel()
+                    break
                 
-            except Exception as e:
-                self.log.emit(f"❌ Ошибка при создании {pdf_name}: {e}")
+                pdf_name = futures[future]
+                try:
+                    future.result()
+                    created_files.append(pdf_name)
+                    self.log.emit(f"✅ Создан: {pdf_name}")
+                except Exception as e:
+                    self.log.emit(f"❌ Ошибка при создании {pdf_name}: {e}")
+        
+        # Части завершаются в произвольном порядке — возвращаем их по номерам
+        created_files.sort()
+        self.created_files.extend(created_files)
         
         return created_files
 
@@ -728,11 +1113,21 @@ class PDFUpscaler(QThread):
     progress = pyqtSignal(int, str)  # прогресс в процентах и сообщение
     finished = pyqtSignal(bool, list)  # возвращаем список созданных файлов
     
+    RENDER_PAGES_PER_TASK = 8  # Страниц PDF, которые один процесс рендерит за задачу
+    UPSCALE_BATCH_PAGES = 32  # Страниц в одной пачке для одного запуска Real-ESRGAN
+    PIPELINE_DEPTH = 2  # Сколько готовых пачек может ждать апскейла
+    UPSCALE_WORKERS = 2  # Сколько запусков Real-ESRGAN может идти одновременно
+    RAM_TEMP_RESERVE = 1024 ** 3  # Сколько RAM должно остаться свободным при кадрах в /dev/shm
+    PROCESS_POLL_INTERVAL = 0.1  # Как часто проверять Real-ESRGAN и готовые страницы (сек)
+    
     def __init__(self, input_files):
         super().__init__()
         self.input_files = input_files  # список файлов для апскейла
         self._stop_flag = False
         self.output_folder = "upscaled"
+        # Готовые страницы текущего файла: их отмечают все одновременные запуски Real-ESRGAN
+        self._pages_done = 0
+        self._progress_lock = threading.Lock()
         
     def run(self):
         try:
@@ -745,8 +1140,9 @@ class PDFUpscaler(QThread):
                 return
             
             # Создаем папку для апскейленных файлов
-            if not os.path.exists(self.output_folder):
-                os.makedirs(self.output_folder)
+            was_created = not os.path.isdir(self.output_folder)
+            os.makedirs(self.output_folder, exist_ok=True)
+            if was_created:
                 self.log.emit(f"📁 Создана папка: {self.output_folder}")
             
             total_files = len(self.input_files)
@@ -776,128 +1172,106 @@ class PDFUpscaler(QThread):
                         upscaled_files.append(output_pdf)
                         continue
                     
-                    doc = fitz.open(input_pdf)
-                    total_pages = len(doc)
-                    doc.close()
+                    with fitz.open(input_pdf) as doc:
+                        total_pages = doc.page_count
+                        frame_bytes = _bmp_frame_size(doc[0].rect) if total_pages else 0
                     
                     self.log.emit(f"📊 Всего страниц в PDF: {total_pages}")
                     
-                    temp_img_folder = f'temp_pdf_images_{file_index}'
-                    upscaled_img_folder = f'upscaled_pdf_images_{file_index}'
-                    os.makedirs(temp_img_folder, exist_ok=True)
-                    os.makedirs(upscaled_img_folder, exist_ok=True)
-                    
-                    # Извлечение страниц
-                    doc = fitz.open(input_pdf)
-                    image_paths = []
-                    
-                    for i in range(total_pages):
-                        if self._stop_flag:
-                            break
+                    # Временные папки удаляются в finally: и при остановке, и при ошибке
+                    temp_folders = []
+                    try:
+                        # Несжатые кадры живут недолго, поэтому по возможности держим их в RAM (tmpfs)
+                        temp_img_folder = tempfile.mkdtemp(prefix=f'mdl_pages_{file_index}_',
+                                                           dir=self._ram_temp_dir(frame_bytes))
+                        temp_folders.append(temp_img_folder)
+                        # Каждый запуск получает новую пустую папку, чтобы в PDF не попали
+                        # страницы, оставшиеся от прерванной обработки другого файла
+                        upscaled_img_folder = tempfile.mkdtemp(prefix=f'mdl_upscaled_{file_index}_')
+                        temp_folders.append(upscaled_img_folder)
+                        
+                        # Рендер и апскейл идут конвейером: пока Real-ESRGAN обрабатывает
+                        # одну пачку страниц, поток рендера уже готовит следующие
+                        batches = queue.Queue(maxsize=self.PIPELINE_DEPTH)
+                        render_errors = []
+                        renderer = threading.Thread(
+                            target=self._render_batches,
+                            args=(input_pdf, total_pages, temp_img_folder, batches, render_errors),
+                            daemon=True
+                        )
+                        renderer.start()
+                        
+                        # Несколько запусков Real-ESRGAN идут одновременно: пока один загружает
+                        # модель и читает кадры, GPU уже занят пачкой другого
+                        upscalers = ThreadPoolExecutor(max_workers=self.UPSCALE_WORKERS)
+                        running = deque()
+                        self._pages_done = 0
+                        try:
+                            while True:
+                                # Пачку забираем из очереди, только когда есть свободный запуск, —
+                                # иначе, пока она ждет, рендер успеет положить в очередь еще одну
+                                while len(running) >= self.UPSCALE_WORKERS:
+                                    running.popleft().result()
+                                try:
+                                    batch = batches.get(timeout=0.5)
+                                except queue.Empty:
+                                    if self._stop_flag:
+                                        break
+                                    continue
+                                if batch is None or self._stop_flag:
+                                    break
+                                
+                                running.append(upscalers.submit(
+                                    self._upscale_batch, realesrgan_path, batch, upscaled_img_folder,
+                                    total_pages, file_index, total_files
+                                ))
                             
-                        page = doc[i]
-                        pix = page.get_pixmap(matrix=fitz.Matrix(2, 2), dpi=150)
-                        img_path = os.path.join(temp_img_folder, f"page_{i+1:04d}.png")
-                        pix.save(img_path)
-                        image_paths.append(img_path)
-                    
-                    doc.close()
-                    
-                    if self._stop_flag:
-                        self._cleanup_folders([temp_img_folder, upscaled_img_folder])
-                        break
-                    
-                    # Апскейл изображений
-                    upscaled_image_paths = []
-                    
-                    for i, img_path in enumerate(image_paths):
+                            while running:
+                                running.popleft().result()
+                        finally:
+                            upscalers.shutdown(wait=True)
+                            renderer.join()
+                        
+                        if render_errors and not self._stop_flag:
+                            raise render_errors[0]
+                        
+                        # Пачки апскейлятся параллельно, поэтому страницы собираются из папки
+                        # в конце и сортируются по номеру, а не по порядку появления
+                        upscaled_image_paths = sorted(glob.glob(os.path.join(upscaled_img_folder, 'page_*.png')),
+                                                      key=_page_number)
+                        
                         if self._stop_flag:
                             break
-                            
-                        page_num = i + 1
                         
-                        imgname = os.path.splitext(os.path.basename(img_path))[0]
-                        output_name = f'{imgname}_upscaled.png'
-                        output_path = os.path.join(upscaled_img_folder, output_name)
+                        if not upscaled_image_paths:
+                            self.log.emit("❌ Нет апскейленных изображений!")
+                            continue
                         
-                        cmd = [
-                            realesrgan_path,
-                            '-i', img_path,
-                            '-o', output_path,
-                            '-n', 'realesr-animevideov3',
-                            '-s', '2',
-                            '-f', 'png'
-                        ]
+                        # Упавший запуск Real-ESRGAN теряет целую пачку: неполный PDF не собираем,
+                        # иначе при повторном запуске он был бы пропущен как уже готовый
+                        found_pages = {_page_number(p) for p in upscaled_image_paths}
+                        missing_pages = [n for n in range(1, total_pages + 1) if n not in found_pages]
+                        if missing_pages:
+                            self.log.emit(f"❌ Не апскейлены страницы {_page_ranges(missing_pages)} "
+                                          f"из {total_pages}, PDF не создан")
+                            continue
                         
+                        # Создание PDF
                         try:
-                            self.log.emit(f"🔍 Апскейл страницы {page_num}/{total_pages}...")
-                            
-                            # Скрываем консоль при запуске subprocess
-                            if sys.platform == "win32":
-                                # На Windows используем CREATE_NO_WINDOW
-                                startupinfo = subprocess.STARTUPINFO()
-                                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                                startupinfo.wShowWindow = subprocess.SW_HIDE
-                                
-                                process = subprocess.Popen(cmd, 
-                                                         stdout=subprocess.PIPE, 
-                                                         stderr=subprocess.STDOUT,
-                                                         text=True, 
-                                                         bufsize=1,
-                                                         universal_newlines=True,
-                                                         startupinfo=startupinfo)
-                            else:
-                                # На Linux/Mac
-                                process = subprocess.Popen(cmd,
-                                                         stdout=subprocess.PIPE,
-                                                         stderr=subprocess.STDOUT,
-                                                         text=True,
-                                                         bufsize=1,
-                                                         universal_newlines=True)
-                            
-                            for line in process.stdout:
-                                if self._stop_flag:
-                                    process.terminate()
-                                    break
-                                # Фильтруем вывод, показываем только прогресс
-                                line = line.strip()
-                                if line and '%' in line:
-                                    # Извлекаем процент
-                                    percent_match = re.search(r'(\d+\.?\d*)%', line)
-                                    if percent_match:
-                                        percent = percent_match.group(1)
-                                        self.log.emit(f"  📊 Прогресс: {percent}%")
-                            
-                            process.wait()
-                            
-                            if process.returncode == 0:
-                                upscaled_image_paths.append(output_path)
-                            else:
-                                self.log.emit(f"❌ Ошибка апскейла страницы {page_num}")
-                                
+                            # PDF пишется прямо в файл, а каждая страница удаляется с диска,
+                            # как только img2pdf ее прочитал. Real-ESRGAN отдает 8-битные RGB PNG
+                            # без альфа-канала, которые встроенный движок img2pdf вставляет как есть,
+                            # без декодирования пикселей
+                            with open(output_pdf, "wb") as f:
+                                img2pdf.convert([_ConsumedImage(p) for p in upscaled_image_paths],
+                                                outputstream=f, engine=img2pdf.Engine.internal)
+                            upscaled_files.append(output_pdf)
+                            self.log.emit(f"✅ PDF успешно создан: {output_pdf}")
                         except Exception as e:
-                            self.log.emit(f"❌ Ошибка при апскейле страницы {page_num}: {e}")
-                    
-                    if self._stop_flag:
-                        self._cleanup_folders([temp_img_folder, upscaled_img_folder])
-                        break
-                    
-                    if not upscaled_image_paths:
-                        self.log.emit("❌ Нет апскейленных изображений!")
-                        self._cleanup_folders([temp_img_folder, upscaled_img_folder])
-                        continue
-                    
-                    # Создание PDF
-                    try:
-                        with open(output_pdf, "wb") as f:
-                            f.write(img2pdf.convert(upscaled_image_paths))
-                        upscaled_files.append(output_pdf)
-                        self.log.emit(f"✅ PDF успешно создан: {output_pdf}")
-                    except Exception as e:
-                        self.log.emit(f"❌ Ошибка создания PDF: {e}")
-                    
-                    # Очистка временных файлов
-                    self._cleanup_folders([temp_img_folder, upscaled_img_folder])
+                            self.log.emit(f"❌ Ошибка создания PDF: {e}")
+                    finally:
+                        # Очистка временных файлов
+                        self._cleanup_folders(temp_folders)
                     
                 except Exception as e:
                     self.log.emit(f"❌ Ошибка при обработке файла {input_pdf}: {e}")
@@ -921,35 +1295,153 @@ class PDFUpscaler(QThread):
             self.log.emit(traceback.format_exc())
             self.finished.emit(False, [])
     
+    def _upscale_batch(self, realesrgan_path, batch, upscaled_img_folder, total_pages, file_index, total_files):
+        """Апскейлит одну пачку страниц одним запуском Real-ESRGAN (выполняется в рабочем потоке)"""
+        batch_dir, first_page, last_page = batch
+        cmd = [
+            realesrgan_path,
+            '-i', batch_dir,
+            '-o', upscaled_img_folder,
+            '-n', 'realesr-animevideov3',
+            '-s', '2',
+            '-f', 'png'
+        ]
+        
+        try:
+            self.log.emit(f"🔍 Апскейл страниц {first_page}-{last_page} из {total_pages}...")
+            returncode = self._run_realesrgan(cmd, first_page, last_page, upscaled_img_folder,
+                                              total_pages, file_index, total_files)
+            if returncode != 0 and not self._stop_flag:
+                self.log.emit(f"❌ Real-ESRGAN завершился с ошибкой (код {returncode})")
+        except Exception as e:
+            self.log.emit(f"❌ Ошибка при апскейле страниц: {e}")
+        
+        # Исходные кадры пачки больше не нужны: на диске одновременно лежит не больше
+        # PIPELINE_DEPTH + UPSCALE_WORKERS + 1 пачек несжатых страниц
+        # (ждут в очереди, апскейлятся и одна рендерится)
+        self._cleanup_folders([batch_dir])
+    
+    def _run_realesrgan(self, cmd, first_page, last_page, upscaled_img_folder,
+                        total_pages, file_index, total_files):
+        """
+        Запускает Real-ESRGAN и возвращает код завершения. Прогресс считается
+        по готовым страницам в upscaled_img_folder, вывод процесса не читается.
+        """
+        # Скрываем консоль при запуске subprocess: на Windows процесс создается
+        # сразу без окна, на Linux/Mac флаги не нужны
+        creationflags = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+        process = subprocess.Popen(cmd,
+                                   stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL,
+                                   creationflags=creationflags)
+        
+        # Страницы пачки, которые Real-ESRGAN еще не записал
+        pending = [os.path.join(upscaled_img_folder, f"page_{n:04d}.png")
+                   for n in range(first_page, last_page + 1)]
+        while process.poll() is None:
+            if self._stop_flag:
+                process.terminate()
+                break
+            time.sleep(self.PROCESS_POLL_INTERVAL)
+            remaining = [p for p in pending if not os.path.exists(p)]
+            if len(remaining) != len(pending):
+                # Счетчик общий для всех пачек, поэтому прогресс не скачет между ними
+                with self._progress_lock:
+                    self._pages_done += len(pending) - len(remaining)
+                    pages_done = self._pages_done
+                    self.progress.emit(int((file_index - 1 + pages_done / total_pages) / total_files * 100),
+                                       f"Апскейл файла {file_index}/{total_files}, страница {pages_done}/{total_pages}...")
+                pending = remaining
+        
+        process.wait()
+        if process.returncode == 0:
+            self.log.emit(f"  📊 Страницы {first_page}-{last_page}/{total_pages} готовы")
+        return process.returncode
+    
+    def _ram_temp_dir(self, frame_bytes):
+        """
+        Возвращает /dev/shm, если в нем и в свободной RAM помещаются все пачки кадров,
+        которые могут одновременно лежать на диске, иначе None (системная временная папка).
+        frame_bytes - размер одного кадра, оценка по первой странице. На Windows всегда %TEMP%.
+        """
+        ram_dir = '/dev/shm'
+        # Столько пачек одновременно ждут в очереди, апскейлятся и рендерятся (см. _upscale_batch)
+        max_batches = self.PIPELINE_DEPTH + self.UPSCALE_WORKERS + 1
+        needed = frame_bytes * self.UPSCALE_BATCH_PAGES * max_batches
+        try:
+            if not os.path.isdir(ram_dir) or shutil.disk_usage(ram_dir).free < needed:
+                return None
+            # Файлы в tmpfs занимают RAM, которую система не может освободить,
+            # поэтому после них должен оставаться запас свободной памяти
+            free_ram = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+            if free_ram - needed < self.RAM_TEMP_RESERVE:
+                return None
+            return ram_dir
+        except (OSError, ValueError, AttributeError):
+            pass
+        return None
+    
+    def _render_batches(self, input_pdf, total_pages, temp_img_folder, batches, errors):
+        """
+        Рендерит страницы PDF пачками по UPSCALE_BATCH_PAGES в отдельные папки
+        и передает готовые пачки в очередь на апскейл. В конце кладет в очередь None.
+        """
+        try:
+            batch_size = self.UPSCALE_BATCH_PAGES
+            chunk = self.RENDER_PAGES_PER_TASK
+            workers = max(1, min((batch_size + chunk - 1) // chunk, os.cpu_count() or 1))
+            
+            # PyMuPDF не потокобезопасен, поэтому рендер идет в процессах,
+            # и каждый процесс один раз открывает PDF сам
+            with ProcessPoolExecutor(max_workers=workers, initializer=_open_render_document,
+                                     initargs=(input_pdf,)) as executor:
+                for first in range(0, total_pages, batch_size):
+                    if self._stop_flag:
+                        break
+                    
+                    last = min(first + batch_size, total_pages)
+                    batch_dir = os.path.join(temp_img_folder, f"batch_{first // batch_size + 1:04d}")
+                    os.makedirs(batch_dir, exist_ok=True)
+                    
+                    futures = [executor.submit(_render_pdf_pages, range(start, min(start + chunk, last)), batch_dir)
+                               for start in range(first, last, chunk)]
+                    for future in as_completed(futures):
+                        if self._stop_flag:
+                            for f in futures:
+                                f.cancel()
+                            break
+                        future.result()
+                    
+                    if self._stop_flag:
+                        break
+                    
+                    self.log.emit(f"🖼️ Извлечено страниц: {last}/{total_pages}")
+                    if not self._put_batch(batches, (batch_dir, first + 1, last)):
+                        break
+        except Exception as e:
+            errors.append(e)
+        finally:
+            self._put_batch(batches, None)
+    
+    def _put_batch(self, batches, item):
+        """Кладет пачку в очередь, не зависая при остановке апскейла"""
+        while not self._stop_flag:
+            try:
+                batches.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
     def _find_realesrgan(self):
         """Находит путь к realesrgan"""
-        if getattr(sys, 'frozen', False):
-            # Если запущено из EXE
-            if hasattr(sys, '_MEIPASS'):
-                base_path = sys._MEIPASS
-            else:
-                base_path = os.path.dirname(sys.executable)
-            
-            # Ищем в разных местах
-            paths_to_try = [
-                os.path.join(base_path, 'realesrgan-ncnn-vulkan-20220424-windows', 'realesrgan-ncnn-vulkan.exe'),
-                os.path.join(base_path, 'realesrgan-ncnn-vulkan.exe'),
-                os.path.join('.', 'realesrgan-ncnn-vulkan-20220424-windows', 'realesrgan-ncnn-vulkan.exe'),
-                os.path.join('.', 'realesrgan-ncnn-vulkan.exe'),
-            ]
-        else:
-            # Если запущено из скрипта
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            paths_to_try = [
-                os.path.join(script_dir, 'realesrgan-ncnn-vulkan-20220424-windows', 'realesrgan-ncnn-vulkan.exe'),
-                os.path.join(script_dir, 'realesrgan-ncnn-vulkan.exe'),
-            ]
-        
-        for path in paths_to_try:
-            if os.path.exists(path):
-                self.log.emit(f"✅ Найден Real-ESRGAN: {path}")
-                return path
+        path = _locate_realesrgan(getattr(sys, 'frozen', False))
+        if path:
+            self.log.emit(f"✅ Найден Real-ESRGAN: {path}")
+            return path
         
+        # Неудачный поиск не кэшируем: пользователь может положить файл и повторить
+        _locate_realesrgan.cache_clear()
         self.log.emit("❌ Real-ESRGAN не найден!")
         self.log.emit("📥 Скачайте с: https://github.com/xinntao/Real-ESRGAN/releases")
         self.log.emit("📁 Положите в папку с программой")
@@ -958,16 +1450,7 @@ class PDFUpscaler(QThread):
     def _cleanup_folders(self, folders):
         """Очищает временные папки"""
         for folder in folders:
-            if os.path.exists(folder):
-                try:
-                    for f in os.listdir(folder):
-                        try:
-                            os.remove(os.path.join(folder, f))
-                        except:
-                            pass
-                    os.rmdir(folder)
-                except Exception as e:
-                    pass
+            shutil.rmtree(folder, ignore_errors=True)
     
     def stop(self):
         """Останавливает процесс апскейла"""
@@ -1198,7 +1681,7 @@ class MangaDownloaderApp(QWidget):
         self.download_progress.setValue(0)
         self.created_files = created_files
         
-        if self.manga_worker._is_cancelled:
+        if self.manga_worker._cancel.is_set():
             self.download_logs.append("🛑 Скачивание отменено пользователем")
             self.status_label.setText("Скачивание отменено")
             self.status_label.setStyleSheet("color: #ff9800; padding: 5px;")
@@ -1301,4 +1784,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # Нужно для ProcessPoolExecutor в собранном EXE
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file